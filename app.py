@@ -1,21 +1,114 @@
-import os, datetime
+import os, time, uuid, threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 load_dotenv()
 
-import pandas as pd
-from model.grobid_parse import GrobidParser
-from flask import (Flask, request, redirect, render_template, flash,
+from model.grobid_parse import GrobidParser, export_csv
+from flask import (Flask, request, redirect, render_template, flash, jsonify,
                     url_for, send_from_directory, session, after_this_request)
 
 app = Flask(__name__)
 app.secret_key = os.urandom(12)
 
 STATIC_FOLDER = os.environ.get('STATIC_FOLDER')
-ALLOWED_EXTENSIONS = set(['pdf'])
+# Share one parser between requests so its HTTP session and logger are set up once
+GROBID_PARSER = GrobidParser()
+# Parse uploads in the background so requests return while Grobid is working.
+# Vercel freezes the function once the response is sent and polls may reach another instance,
+# so there (or with PARSE_WORKERS=0) the upload is parsed within its own request
+PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', 0 if os.environ.get('VERCEL') else 4))
+executor = ThreadPoolExecutor(max_workers=PARSE_WORKERS) if PARSE_WORKERS > 0 else None
+# Remove cached files off the request thread, unless work has to finish within the request like parsing
+cleanup_executor = ThreadPoolExecutor(max_workers=2) if executor is not None else None
+# Finished jobs nobody collected (reloaded page, closed tab, new upload) are dropped after this many seconds
+JOB_TIMEOUT = int(os.environ.get('JOB_TIMEOUT', 600))
+jobs = {}
+jobs_lock = threading.Lock()
 
 # Check file format
 def allowed_file(filename: str) -> bool:
-    return '.' in filename and filename.rsplit('.')[-1] in ALLOWED_EXTENSIONS
+    return filename.lower().endswith('.pdf')
+
+def clear_folder(folder: str):
+    """Remove the cached files in the folder, except those of jobs still tracked or younger than JOB_TIMEOUT"""
+    # Another visitor's upload may be queued, parsing or waiting for its download
+    with jobs_lock:
+        active = set(jobs)
+    cutoff = time.time() - JOB_TIMEOUT
+    with os.scandir(folder) as it:
+        for entry in it:
+            try:
+                # Files are named <job_id>.pdf, <job_id>.grobid.tei.xml and <job_id>_results.csv
+                job_id = entry.name.split('.', 1)[0].split('_', 1)[0]
+                if job_id in active or entry.stat().st_mtime > cutoff:
+                    continue
+                os.remove(entry.path)
+            except:
+                pass
+
+def cleanup(func, *args):
+    """Run a cleanup task on the cleanup thread, or right away without background workers"""
+    if cleanup_executor is None:
+        func(*args)
+    else:
+        cleanup_executor.submit(func, *args)
+
+def remove_job_files(job_id: str):
+    """Remove the upload, TEI and CSV files of a parsing job"""
+    for filename in (f"{job_id}.pdf", f"{job_id}.grobid.tei.xml", f"{job_id}_results.csv"):
+        try:
+            os.remove(os.path.join(STATIC_FOLDER, filename))
+        except FileNotFoundError:
+            pass
+
+def evict_jobs():
+    """Drop finished jobs that were not collected within JOB_TIMEOUT of their upload"""
+    now = time.monotonic()
+    with jobs_lock:
+        expired = [job_id for job_id, (future, submitted) in jobs.items()
+                   if future.done() and now - submitted > JOB_TIMEOUT]
+        for job_id in expired:
+            del jobs[job_id]
+    for job_id in expired:
+        cleanup(remove_job_files, job_id)
+
+def parse_upload(job_id: str):
+    """Parse an uploaded PDF and export the results, return (result, error message)"""
+    grobid_parser = GROBID_PARSER
+    filepath = os.path.join(STATIC_FOLDER, f"{job_id}.pdf")
+    grobid_parser.logger.info("Processing %s.pdf", job_id)
+    # The TEI file is removed right after export, so a parse cache would never be reused
+    result = grobid_parser.parse_pdf(STATIC_FOLDER, f"{job_id}.pdf", use_cache=False)
+    if isinstance(result, dict):
+        grobid_parser.logger.info("Successfully parsed %s.pdf", job_id)
+        output_path = f"{STATIC_FOLDER}/{job_id}_results.csv"
+        export_csv(result, output_path)
+
+        if os.path.exists(output_path):
+            grobid_parser.logger.info("Parsed results saved to %s", output_path)
+            os.remove(filepath)
+            os.remove(f"{STATIC_FOLDER}/{job_id}.grobid.tei.xml")
+            return result, None
+        else:
+            grobid_parser.logger.error("Failed to export parse result")
+            return None, "Failed to export parsed result"
+    else:
+        grobid_parser.logger.error("Failed to parse %s.pdf", job_id)
+        return None, "Failed to parse this file"
+
+def show_result(job_id: str, get_result):
+    """Render the outcome of a parsing job, get_result returns the (result, error message) of parse_upload"""
+    try:
+        result, error = get_result()
+    except Exception as e:
+        GROBID_PARSER.logger.error("Parsing job %s failed: %s", job_id, e)
+        result, error = None, "Failed to parse this file"
+    if error:
+        flash(error, 'danger')
+        return render_template('index.html')
+    # Render the result with this response only, the session cookie just carries the job id
+    flash("Success", 'success')
+    return render_template('index.html', result=result, csv_filename=f"{job_id}_results.csv")
 
 @app.route('/', methods=['GET','POST'])
 def mainpage():
@@ -24,14 +117,10 @@ def mainpage():
         if request.headers.get('Cache-Control') == 'max-age=0':
             session.clear()
             # Clear any cached files
-            for file in os.listdir(STATIC_FOLDER):
-                try:
-                    os.remove(os.path.join(STATIC_FOLDER, file))
-                except:
-                    pass
+            cleanup(clear_folder, STATIC_FOLDER)
         return render_template('index.html')
     
-    # If user uploads a PDF file, parse it and return the results
+    # If user uploads a PDF file, queue it for parsing and let the page poll the job
     if request.method == 'POST':
         file = request.files['file']
         if not file or not allowed_file(file.filename):
@@ -39,39 +128,52 @@ def mainpage():
             return render_template('index.html')
         
         if file and allowed_file(file.filename):
-            # Use current time as file name
-            now = datetime.datetime.now()
-            currentTime = now.strftime("%Y-%m-%d_%H-%M-%S")
-            filepath = os.path.join(STATIC_FOLDER, f"{currentTime}.pdf")
+            # Name the files by job id, so concurrent uploads never share (and delete) each other's files
+            job_id = uuid.uuid4().hex
+            os.makedirs(STATIC_FOLDER, exist_ok=True)
+            filepath = os.path.join(STATIC_FOLDER, f"{job_id}.pdf")
             file.save(filepath)
 
-            # Call GROBID service
-            grobid_parser = GrobidParser()
-            grobid_parser.logger.info(f"Processing {currentTime}.pdf")
-            result = grobid_parser.parse_pdf(STATIC_FOLDER, f"{currentTime}.pdf")
-            if isinstance(result, dict):
-                grobid_parser.logger.info(f"Successfully parsed {currentTime}.pdf")
-                df = pd.DataFrame(result)
-                output_path = f"{STATIC_FOLDER}/{currentTime}_results.csv"
-                df.to_csv(output_path)
-
-                if os.path.exists(output_path):
-                    grobid_parser.logger.info(f"Parsed results saved to {output_path}")
-                    os.remove(filepath)
-                    os.remove(f"{STATIC_FOLDER}/{currentTime}.grobid.tei.xml")
-                    # Store results in session
-                    session['result'] = result
-                    session['csv_filename'] = f"{currentTime}_results.csv"
-                    flash("Success", 'success')
-                    return render_template('index.html')
-                else:
-                    grobid_parser.logger.error(f"Failed to export parse result")
-                    flash("Failed to export parsed result", 'danger')
-                    return render_template('index.html')
-            else:
-                grobid_parser.logger.error(f"Failed to parse {currentTime}.pdf")
-                flash(f"Failed to parse this file", 'danger')
-                return render_template('index.html')
+            if executor is None:
+                # No background workers, parse within this request
+                return show_result(job_id, lambda: parse_upload(job_id))
+
+            # Call GROBID service in the background
+            evict_jobs()
+            with jobs_lock:
+                jobs[job_id] = (executor.submit(parse_upload, job_id), time.monotonic())
+            session['job_id'] = job_id
+            flash("Processing, please wait", 'info')
+            return render_template('index.html', job_id=job_id)
+
+# Route for polling the state of a parsing job
+@app.route('/status/<job_id>')
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None or session.get('job_id') != job_id:
+        return jsonify(state="UNKNOWN"), 404
+    future = job[0]
+    if not future.done():
+        return jsonify(state="PENDING")
+    if future.exception() is None and future.result()[1] is None:
+        return jsonify(state="SUCCESS")
+    return jsonify(state="FAILURE")
+
+# Route for showing the results of a finished parsing job
+@app.route('/result/<job_id>')
+def job_result(job_id):
+    job = jobs.get(job_id)
+    if job is None or session.get('job_id') != job_id:
+        flash("Parsing job not found", 'danger')
+        return redirect(url_for("mainpage"))
+    future = job[0]
+    if not future.done():
+        return render_template('index.html', job_id=job_id)
+
+    with jobs_lock:
+        jobs.pop(job_id, None)
+    session.pop('job_id', None)
+    return show_result(job_id, future.result)
 
 # Route for downloading the CSV file
 @app.route('/download/<filename>')
@@ -84,7 +186,7 @@ def download_file(filename):
             try:
                 os.remove(os.path.join(STATIC_FOLDER, filename))
             except Exception as error:
-                print("Error removing file: %s", error)
+                GROBID_PARSER.logger.error("Error removing file: %s", error)
             return response
         return return_value
     except Exception as e:
@@ -92,4 +194,4 @@ def download_file(filename):
         return redirect(url_for("mainpage"))
 
 if __name__ == '__main__':
-    app.run()
\ No newline at end of file
+    app.run()
@@ -0,0 +1,79 @@
+# cython: language_level=3
+"""Compiled version of reconstruct_paragraph in model/grobid_parse.py, which hands over its regexes"""
+
+# source_digest() of the reconstruct_paragraph this is ported from, update it along with the port.
+# setup.py refuses to build a stale port and grobid_parse falls back to Python when they differ
+PORTED_FROM = "04abc420f8a571cd"
+
+cdef object _FIG_TBL_RE = None
+cdef object _SUPP_RE = None
+
+def use_patterns(object fig_tbl_re, object supp_re):
+    """Share the compiled regexes of model/grobid_parse.py"""
+    global _FIG_TBL_RE, _SUPP_RE
+    _FIG_TBL_RE = fig_tbl_re
+    _SUPP_RE = supp_re
+
+cpdef str reconstruct_paragraph(object paragraph, dict reference_dict):
+    if paragraph is None:
+        return ""
+
+    cdef bint switch = False # Determine the ')' or ' 'comes from figure/table or bib reference or not
+    cdef bint last_was_ref = False # Separate consecutive bib references with a space
+    cdef list parts = []
+    cdef list contents = []
+    cdef str text_end, paragraph_content
+    cdef object element, child, text, etype, target, ref
+
+    if not len(paragraph):
+        # Plain prose without <ref> or any other child, a single regex pass is all the loop below would do
+        text = paragraph.text
+        return _SUPP_RE.sub('', text) if text else ""
+
+    # Text nodes and child elements in document order, comments are skipped
+    text = paragraph.text
+    if text:
+        contents.append(text)
+    for child in paragraph.iterchildren():
+        if type(child.tag) is str:
+            contents.append(child)
+        text = child.tail
+        if text:
+            contents.append(text)
+
+    for element in contents:
+        if type(element) is str:
+            text_end = <str>element
+            if switch and text_end.startswith((')', ' ')):
+                text_end = text_end[1:]
+
+            switch = False
+            text_end = _SUPP_RE.sub('', text_end)
+            if text_end:
+                parts.append(text_end)
+                last_was_ref = False
+            continue
+
+        etype = element.get('type')
+        target = element.get('target')
+        if etype == "bibr" and target and reference_dict:
+            # Target looks like "#b12", the xml:id of the biblStruct without '#'
+            ref = reference_dict.get(target.lstrip('#'))
+            if ref is None:
+                # If the target id not exist in reference_dict
+                continue
+            if last_was_ref:
+                parts.append(" ")
+            parts.append(ref["bib_ref"])
+            last_was_ref = True
+            switch = True
+
+        elif etype:
+            # Handle figure/table references
+            # You cannot remove the ')' because they does not appeared in the paragraph_content yet
+            paragraph_content = _FIG_TBL_RE.sub('', ''.join(parts))
+            parts = [paragraph_content]
+            last_was_ref = paragraph_content.endswith("[/bib_ref]")
+            switch = True
+
+    return ''.join(parts)
@@ -1,18 +1,77 @@
 import warnings
 warnings.filterwarnings("ignore")
-import os, re, html
+import os, re, html, csv, glob, json, uuid, hashlib, inspect, argparse
+from itertools import chain
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 load_dotenv()
 
 import requests
-from bs4 import BeautifulSoup, NavigableString, Tag
+from requests.adapters import HTTPAdapter
+from requests_toolbelt import MultipartEncoder
+from lxml import etree
 import logging
 
+TEI_NS = "http://www.tei-c.org/ns/1.0"
+NS = {"tei": TEI_NS}
+XML_ID = "{http://www.w3.org/XML/1998/namespace}id"
+XML_LANG = "{http://www.w3.org/XML/1998/namespace}lang"
+TEI_TAG = f"{{{TEI_NS}}}TEI"
+HEAD_TAG = f"{{{TEI_NS}}}head"
+HEADER_TAG = f"{{{TEI_NS}}}teiHeader"
+ABSTRACT_TAG = f"{{{TEI_NS}}}abstract"
+DIV_TAG = f"{{{TEI_NS}}}div"
+LIST_BIBL_TAG = f"{{{TEI_NS}}}listBibl"
+BIBL_STRUCT_TAG = f"{{{TEI_NS}}}biblStruct"
+BODY_TAG = f"{{{TEI_NS}}}body"
+BACK_TAG = f"{{{TEI_NS}}}back"
+TITLE_TAG = f"{{{TEI_NS}}}title"
+AUTHOR_TAG = f"{{{TEI_NS}}}author"
+FORENAME_TAG = f"{{{TEI_NS}}}forename"
+SURNAME_TAG = f"{{{TEI_NS}}}surname"
+# Elements handled while streaming the TEI, everything else is freed along with them
+_STREAM_TAGS = (HEADER_TAG, DIV_TAG, BIBL_STRUCT_TAG, BODY_TAG, BACK_TAG)
+
+# Compile XPath queries once, every document reuses them
+# Parts of teiHeader, located once per document so the helpers below only search inside them
+_TITLE_STMT = etree.XPath("tei:fileDesc/tei:titleStmt", namespaces=NS)
+_PUBLICATION_STMT = etree.XPath("tei:fileDesc/tei:publicationStmt", namespaces=NS)
+_SOURCE_BIBL = etree.XPath("tei:fileDesc/tei:sourceDesc/tei:biblStruct", namespaces=NS)
+_MONOGR = etree.XPath("tei:monogr", namespaces=NS)
+_MAIN_TITLE = etree.XPath(".//tei:title[@type='main']", namespaces=NS)
+_IMPRINT = etree.XPath(".//tei:imprint", namespaces=NS)
+_PUBLISHER = etree.XPath(".//tei:publisher", namespaces=NS)
+_DATE = etree.XPath("(.//tei:date)[1]", namespaces=NS)
+_DOI = etree.XPath(".//tei:idno[@type='DOI']", namespaces=NS)
+# Figure/table mentions left before a figure or table reference
+_FIG_TBL_RE = re.compile(r"\s*\(?(?:figure|fig\.?|table)\s*", re.IGNORECASE)
+# Supplementary mentions, optionally preceded by one word (e.g. "see supplementary")
+_SUPP_RE = re.compile(r"\s*\(?\s*,*\s*(?:[a-z]+\s*)?supplementary\s*\)?", re.IGNORECASE)
+# Headings of sections that are left out of the text, matched anywhere in the heading
+IRRELEVANT_SECTIONS = ["acknowledgement", "conflict of interest", "funding", "author contribution", "competing interests",
+                       "supplementary material", "additional information", "supplementary information",
+                       "data availability", "appendix"]
+_IRRELEVANT_RE = re.compile("|".join(re.escape(x) for x in IRRELEVANT_SECTIONS), re.IGNORECASE)
+# HTML tags left in titles once entities are decoded
+_HTML_TAG_RE = re.compile(r"<[^>]+>")
+
+CSV_BUFFER_SIZE = 1 << 20
+# Grobid serves 10 requests at once by default (org.grobid.max.connections)
+GROBID_MAX_CONNECTIONS = 10
+# Bump when the parsed output changes, so cached results of older versions are not reused
+PARSE_CACHE_VERSION = 1
+
 class GrobidParser:
     """Class to handle parsing of PDF documents using Grobid"""
     
-    def __init__(self):
+    def __init__(self, pool_size: int = GROBID_MAX_CONNECTIONS):
         self.grobid_url = os.environ.get('GROBID_URL')
+        # Keep-alive connections to Grobid are reused across PDFs, one per concurrent request
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
         # Set up logging
         log_level = 'INFO'
         logger = logging.getLogger()
@@ -23,20 +82,25 @@ class GrobidParser:
         logger.addHandler(console_handler)
         self.logger = logger
     
-    def parse_pdf(self, root_folder:str, pdf_file: str) -> dict:
-        """Main method to parse PDF and return structured data"""
+    def parse_pdf(self, root_folder:str, pdf_file: str, use_cache: bool = False, header_only: bool = False) -> dict:
+        """Main method to parse PDF and return structured data, header_only skips the article text
+        and use_cache keeps the parsed result in a JSON file next to the XML"""
         try:
+            # _process_pdf only returns a path once the XML file is on disk
             xml_path = self._process_pdf(root_folder, pdf_file)
-            if xml_path and os.path.exists(xml_path):
+            if xml_path:
+                if header_only:
+                    return self._parse_header(xml_path)
+                if use_cache:
+                    return self._parse_xml_cached(xml_path)
                 return self._parse_xml(xml_path)
             return None
         except Exception as e:
-            self.logger.error(f"Error parsing PDF {pdf_file}: {str(e)}")
+            self.logger.error("Error parsing PDF %s: %s", pdf_file, e)
             return None
 
     def _process_pdf(self, root_folder: str, pdf_file: str) -> str:
         """Process PDF through Grobid service"""
-        pdf_content = []
         filename = os.path.splitext(os.path.basename(pdf_file))[0]
         xml_path = os.path.join(root_folder, f'{filename}.grobid.tei.xml')
         
@@ -47,217 +111,415 @@ class GrobidParser:
         try:
             # Official python api client failed, so use request instead
             url = self.grobid_url + "/api/processFulltextDocument"
-            pdf_content += [("input", (open(f"{root_folder}/{pdf_file}", "rb")))]
-            response = requests.post(url, files=pdf_content).text
-            if response is not None:
-                # Export xml content to the disk
-                with open(xml_path, 'w') as fp:
-                    fp.write(response)
+            with open(f"{root_folder}/{pdf_file}", "rb") as fh:
+                # Stream the PDF from disk instead of building the whole multipart body in memory
+                form = MultipartEncoder(fields={"input": (pdf_file, fh, "application/pdf")})
+                response = self.session.post(url, data=form, headers={"Content-Type": form.content_type})
+            response.raise_for_status()
+            # Export the raw bytes, the XML declares its own encoding, and never leave a partial TEI to be reused later
+            write_atomic(xml_path, response.content)
 
             return xml_path
         except Exception as e:
-            self.logger.error(f"Grobid processing failed: {str(e)}")
+            self.logger.error("Grobid processing failed: %s", e)
+            return None
+
+    def _parse_xml_cached(self, xml_file: str) -> dict:
+        """Parse XML output from Grobid, reusing the cached result while the file is unchanged"""
+        # JSON, not pickle: the cache sits in the input folder and loading it must never run code
+        cache_path = f"{xml_file}.cache.json"
+        stat = os.stat(xml_file)
+        key = [PARSE_CACHE_VERSION, stat.st_mtime_ns, stat.st_size]
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached["key"] == key:
+                return cached["result"]
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self.logger.warning("Ignoring unreadable cache %s: %s", cache_path, e)
+
+        result = self._parse_xml(xml_file)
+        if result is None:
             return None
+        try:
+            write_atomic(cache_path, json.dumps({"key": key, "result": result}).encode('utf-8'))
+        except Exception as e:
+            self.logger.warning("Failed to write cache %s: %s", cache_path, e)
+        return result
 
     def _parse_xml(self, xml_file: str) -> dict:
-        """Parse XML output from Grobid"""
+        """Parse XML output from Grobid in a single streaming pass"""
         try:
-            with open(xml_file, 'r', encoding='utf-8') as f:
-                article = BeautifulSoup(f.read(), "lxml")
-            
-            publisher, journal = parse_publisher(article)
-            referencecount, text = parse_text(article)
+            header = None
+            reference_dict = {}
+            abstract_divs, text_divs = [], []
+            context = etree.iterparse(xml_file, events=("end",), tag=_STREAM_TAGS,
+                                      huge_tree=True, recover=True)
+            for _, elem in context:
+                tag = elem.tag
+                if tag == HEADER_TAG:
+                    if is_tei_header(elem):
+                        header = parse_header(elem)
+                elif tag == DIV_TAG and not elem.get("type"):
+                    # Section divs have no type, typed divs in <back> (acknowledgement, annex, references) only wrap them.
+                    # References come after the body, so keep the sections until the bibliography is read
+                    parent = elem.getparent()
+                    if parent.tag == ABSTRACT_TAG:
+                        abstract_divs.append(elem)
+                    else:
+                        text_divs.append(elem)
+                    parent.remove(elem)
+                    continue
+                elif tag == BIBL_STRUCT_TAG:
+                    if elem.getparent().tag != LIST_BIBL_TAG:
+                        # biblStruct of the article itself, read along with teiHeader
+                        continue
+                    reference = parse_reference(elem)
+                    if reference:
+                        reference_dict[elem.get(XML_ID, "")] = reference
+                release_element(elem)
+            del context
+            if header is None:
+                # recover=True reads anything, e.g. an HTML error page, make sure this was a Grobid TEI file
+                self.logger.error("XML parsing failed: %s is not a TEI document", xml_file)
+                return None
+
+            # Free each div as soon as parse_text has rebuilt its text
+            referencecount, text = parse_text(drain(abstract_divs), drain(text_divs), reference_dict)
             return {
-                "title": [parse_title(article)],
-                "language": [parse_language(article)],
-                "publisher": [publisher],
-                "journal": [journal], 
-                "release_year": [parse_year(article)],
-                "doi": [parse_doi(article)],
+                "title": [header.get("title", "")],
+                "language": [header.get("language", "")],
+                "publisher": [header.get("publisher", "")],
+                "journal": [header.get("journal", "")], 
+                "release_year": [header.get("release_year", "")],
+                "doi": [header.get("doi", "")],
                 "referencecount": [referencecount],
                 "text": [text]
             }
         except Exception as e:
-            self.logger.error(f"XML parsing failed: {str(e)}")
+            self.logger.error("XML parsing failed: %s", e)
+            return None
+
+    def _parse_header(self, xml_file: str) -> dict:
+        """Parse only the metadata in teiHeader, stop reading before the article text"""
+        try:
+            header = None
+            context = etree.iterparse(xml_file, events=("end",), tag=HEADER_TAG,
+                                      huge_tree=True, recover=True)
+            for _, elem in context:
+                if is_tei_header(elem):
+                    header = parse_header(elem)
+                elem.clear()
+                # The body after teiHeader is most of the file, never parse it
+                break
+            del context
+            if header is None:
+                self.logger.error("XML header parsing failed: %s is not a TEI document", xml_file)
+                return None
+
+            return {
+                "title": [header.get("title", "")],
+                "language": [header.get("language", "")],
+                "publisher": [header.get("publisher", "")],
+                "journal": [header.get("journal", "")], 
+                "release_year": [header.get("release_year", "")],
+                "doi": [header.get("doi", "")]
+            }
+        except Exception as e:
+            self.logger.error("XML header parsing failed: %s", e)
             return None
 
-def parse_title(article):
-    title_tag = article.find("titlestmt")
-    if not title_tag:
+def write_atomic(path: str, data: bytes):
+    """Write to a temporary file first and move it in place, so readers never see a partial file"""
+    # A plain open() creates the file with the umask permissions like any other output, mkstemp would make it 0600
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, 'xb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+@contextmanager
+def open_csv(output_path: str):
+    """Open a CSV for writing and yield a csv.writer producing the same format as DataFrame.to_csv"""
+    # A 1 MiB buffer keeps the number of write() calls low for long article text
+    with open(output_path, 'w', buffering=CSV_BUFFER_SIZE, newline='', encoding='utf-8') as f:
+        yield csv.writer(f, lineterminator='\n')
+
+def export_csv(result: dict, output_path: str):
+    """Write a parsed result to CSV in the same layout as DataFrame.to_csv"""
+    with open_csv(output_path) as writer:
+        writer.writerow(['', *result.keys()])
+        for index, row in enumerate(zip(*result.values())):
+            writer.writerow([index, *row])
+
+def element_text(element):
+    """Concatenate the text of an element and all of its descendants"""
+    return "".join(element.itertext())
+
+def iter_contents(element):
+    """Yield the text nodes and child elements of an element in document order"""
+    if element.text:
+        yield element.text
+    for child in element.iterchildren():
+        # Skip comments and processing instructions but keep the text after them
+        if isinstance(child.tag, str):
+            yield child
+        if child.tail:
+            yield child.tail
+
+def release_element(elem):
+    """Free a parsed element and the siblings before it, so the streamed tree stays small"""
+    elem.clear()
+    parent = elem.getparent()
+    if parent is None:
+        return
+    while elem.getprevious() is not None:
+        del parent[0]
+
+def drain(elements):
+    """Yield the elements of a list in order, dropping each from the list and freeing it once the consumer moves on"""
+    for index, elem in enumerate(elements):
+        yield elem
+        elements[index] = None
+        elem.clear()
+
+def is_tei_header(header) -> bool:
+    """Whether a teiHeader belongs to a TEI document root"""
+    return header.getroottree().getroot().tag == TEI_TAG
+
+def first(elements):
+    """First result of an XPath query, or None"""
+    return elements[0] if elements else None
+
+def parse_header(header):
+    """Extract the article metadata from teiHeader"""
+    source = first(_SOURCE_BIBL(header))
+    monogr = first(_MONOGR(source)) if source is not None else None
+    publisher, journal = parse_publisher(monogr)
+    return {
+        "title": parse_title(first(_TITLE_STMT(header))),
+        "language": parse_language(header),
+        "publisher": publisher,
+        "journal": journal,
+        "release_year": parse_year(first(_PUBLICATION_STMT(header))),
+        "doi": parse_doi(source)
+    }
+
+def parse_title(title_stmt):
+    if title_stmt is None:
         return ""
-    title = title_tag.find("title", attrs={"type": "main"})
-    title = title.text.strip() if title is not None else ""
+    title = _MAIN_TITLE(title_stmt)
+    title = element_text(title[0]).strip() if title else ""
     # Convert Entities to Symbols
     decode_title = html.unescape(title)
+    if '<' not in decode_title:
+        # Most titles carry no markup, nothing to strip
+        return decode_title.strip()
     # Strip html tag, only keep plain text
-    title_text = BeautifulSoup(decode_title, "html.parser").get_text()
+    title_text = _HTML_TAG_RE.sub('', decode_title).strip()
     return title_text
 
-def parse_language(article):
-    header_tag = article.find("teiheader")
-    language = header_tag.get('xml:lang') if header_tag is not None else ""
+def parse_language(header_tag):
+    language = header_tag.get(XML_LANG) if header_tag is not None else ""
     return language
 
-def parse_publisher(article):
-    monogr_tag = article.find("monogr")
-    if not monogr_tag:
+def parse_publisher(monogr_tag):
+    if monogr_tag is None:
         return "", ""
         
-    journal = monogr_tag.find("title", attrs={"type": "main"})
-    journal = journal.text.strip() if journal else ""
+    journal = _MAIN_TITLE(monogr_tag)
+    journal = element_text(journal[0]).strip() if journal else ""
     
-    imprint = monogr_tag.find("imprint")
+    imprint = _IMPRINT(monogr_tag)
     if not imprint:
         return "", journal
         
-    publisher = imprint.find("publisher")
-    publisher = publisher.text.strip() if publisher else ""
+    publisher = _PUBLISHER(imprint[0])
+    publisher = element_text(publisher[0]).strip() if publisher else ""
     
     return publisher, journal
 
-def parse_year(article):
-    pub_date = article.find("publicationstmt")
-    if not pub_date:
+def parse_year(pub_date):
+    if pub_date is None:
         return ""
-    year = pub_date.find("date")
-    return year.attrs.get("when", "") if year else ""
-
-def parse_doi(article):
-    doi = article.find("idno", attrs={"type": "DOI"})
-    return doi.text.strip() if doi else ""
-
-def parse_references(article):
-    """Extract reference title and author name then store as dictionary type"""
-    reference_list = {}
-    references = article.find("text")
-    if not references:
-        return reference_list
-        
-    references = references.find("div", attrs={"type": "references"})
-    if not references:
-        return reference_list
-        
-    for elem in references.find_all("biblstruct"):
-        ref_id = elem.get('xml:id', "")
-        title = elem.find("title", attrs={"level": "a"})
-        if not title:
-            title = elem.find("title", attrs={"level": "m"})
-        title = title.text if title else ""
-        
-        authors = elem.find_all("author")
-        if (not authors) or (not title):
-            # Only keep the reference that contains both title and author info
-            continue
-            
-        author = authors[0]
-        firstname = author.find("forename", {"type": "first"})
-        firstname = firstname.text.strip() if firstname else ""
-        
-        middlename = author.find("forename", {"type": "middle"})
-        middlename = middlename.text.strip() if middlename else ""
-        
-        lastname = author.find("surname")
-        lastname = lastname.text.strip() if lastname else ""
-        
-        reference_list[ref_id] = {
-            "title": title,
-            "author": f"{lastname} {firstname}{middlename}".strip()
-        }
+    year = _DATE(pub_date)
+    return year[0].get("when", "") if year else ""
+
+def parse_doi(source):
+    if source is None:
+        return ""
+    doi = _DOI(source)
+    return element_text(doi[0]).strip() if doi else ""
+
+def parse_reference(elem):
+    """Extract reference title and author name of a single biblStruct"""
+    # One walk over the entry picks the first article/monograph title and the first author
+    title_a = title_m = author = None
+    for node in elem.iter(TITLE_TAG, AUTHOR_TAG):
+        if node.tag == AUTHOR_TAG:
+            if author is None:
+                author = node
+        elif node.get("level") == "a":
+            if title_a is None:
+                title_a = node
+        elif node.get("level") == "m" and title_m is None:
+            title_m = node
+    title = title_a if title_a is not None else title_m
+    title = element_text(title) if title is not None else ""
+    
+    if (author is None) or (not title):
+        # Only keep the reference that contains both title and author info
+        return None
         
-    return reference_list
+    # Same for the name parts of that author
+    firstname = middlename = lastname = None
+    for node in author.iter(FORENAME_TAG, SURNAME_TAG):
+        if node.tag == SURNAME_TAG:
+            if lastname is None:
+                lastname = node
+        elif node.get("type") == "first":
+            if firstname is None:
+                firstname = node
+        elif node.get("type") == "middle" and middlename is None:
+            middlename = node
+    firstname = element_text(firstname).strip() if firstname is not None else ""
+    middlename = element_text(middlename).strip() if middlename is not None else ""
+    lastname = element_text(lastname).strip() if lastname is not None else ""
+    
+    author = f"{lastname} {firstname}{middlename}".strip()
+    return {
+        "title": title,
+        "author": author,
+        # Formatted once here, papers usually cite the same reference several times
+        "bib_ref": f"[bib_ref] {title}, {author} [/bib_ref]"
+    }
 
 def reconstruct_paragraph(paragraph, reference_dict):
-    if not paragraph or not paragraph.contents:
+    if paragraph is None:
         return ""
+    if not len(paragraph):
+        # Plain prose without <ref> or any other child, a single regex pass is all the loop below would do
+        text = paragraph.text
+        return _SUPP_RE.sub('', text) if text else ""
     
     switch = False # Determine the ')' or ' 'comes from figure/table or bib reference or not
-    paragraph_content = ""
-    for element in paragraph.contents:
-        if (isinstance(element, Tag) and 
-            element.get('type') == "bibr" and 
-            element.get('target') and 
-            reference_dict):
-            try:
-                target_id = str(element.get('target')[1:])
-                ref = reference_dict.get(target_id, "Not Found")
-                if ref == "Not Found":
-                    # If the target id not exist in reference_dict
-                    continue
-                reference_string = f"[bib_ref] {ref['title']}, {ref['author']} [/bib_ref]"
-                if paragraph_content.endswith("[/bib_ref]"):
-                    paragraph_content += " "
-                paragraph_content += reference_string
-                switch = True
-            except (ValueError, IndexError):
-                print(f"Invalid reference target: {element.get('target')}")
+    last_was_ref = False # Separate consecutive bib references with a space
+    parts = []
+    for element in iter_contents(paragraph):
+        # lxml hands text nodes out as plain str, an exact type check is enough
+        if type(element) is str:
+            if switch and element.startswith((')', ' ')):
+                text_end = element[1:]
+            else:
+                text_end = element
+            
+            switch = False
+            text_end = _SUPP_RE.sub('', text_end)
+            if text_end:
+                parts.append(text_end)
+                last_was_ref = False
+            continue
+
+        etype = element.get('type')
+        target = element.get('target')
+        if etype == "bibr" and target and reference_dict:
+            # Target looks like "#b12", the xml:id of the biblStruct without '#'
+            ref = reference_dict.get(target.lstrip('#'))
+            if ref is None:
+                # If the target id not exist in reference_dict
                 continue
+            if last_was_ref:
+                parts.append(" ")
+            parts.append(ref["bib_ref"])
+            last_was_ref = True
+            switch = True
                 
-        elif isinstance(element, Tag) and element.get('type'):
+        elif etype:
             # Handle figure/table references
             # You cannot remove the ')' because they does not appeared in the paragraph_content yet
-            text_end = paragraph_content
-            patterns_to_remove = r"\s*\(?[Ff]igure\s*|\s*\(?[Ff]ig\.?\s*|\s*\(?[Tt]able\s*"
-            text_end = re.sub(patterns_to_remove, '', text_end, flags=re.IGNORECASE)
-            paragraph_content = text_end
+            paragraph_content = _FIG_TBL_RE.sub('', ''.join(parts))
+            parts = [paragraph_content]
+            last_was_ref = paragraph_content.endswith("[/bib_ref]")
             switch = True
-                
-        elif isinstance(element, NavigableString):
-            if switch and (element.text.startswith(')') or element.text.startswith(' ')):
-                text_end = element.text[1:]
-            else:
-                text_end = element.text
             
-            switch = False
-            patterns_to_remove = r"\s*\(?\s*[,]*\s*[Ss]upplementary\s*\)?|\s*\(?\s*[,]*\s*[A-Za-z]+\s*[Ss]upplementary\s*\)?"
-            paragraph_content += re.sub(patterns_to_remove, '', text_end, flags=re.IGNORECASE)
-            
-    return paragraph_content
+    return ''.join(parts)
+
+def source_digest(func) -> str:
+    """Short sha256 of a function's source code"""
+    return hashlib.sha256(inspect.getsource(func).encode('utf-8')).hexdigest()[:16]
 
-def parse_text(article):
-    """Parse and structure the main text content"""
+try:
+    # Compiled version of the loop above, only present after `python setup.py build_ext --inplace`
+    from model import _fast_reconstruct
+except ImportError:
+    _fast_reconstruct = None
+if _fast_reconstruct is not None:
+    _fast_reconstruct.use_patterns(_FIG_TBL_RE, _SUPP_RE)
+    # The port records the source_digest of the reconstruct_paragraph it was ported from, setup.py checks it too
+    try:
+        _ported = _fast_reconstruct.PORTED_FROM == source_digest(reconstruct_paragraph)
+    except OSError:
+        # No source to compare with, e.g. a bytecode-only install
+        _ported = False
+    if _ported:
+        reconstruct_paragraph = _fast_reconstruct.reconstruct_paragraph
+    else:
+        logging.getLogger(__name__).warning(
+            "model._fast_reconstruct was ported from an older reconstruct_paragraph, using the Python version. "
+            "Port the change to model/_fast_reconstruct.pyx, update PORTED_FROM and rebuild")
+
+def parse_text(abstract_text, divs, reference_dict):
+    """Parse and structure the main text content from the abstract and section divs,
+    both can be any iterable of divs and are read once"""
     common_titles = ["abstract", "introduction", "materialandmethods", "methods", "results", "discussion", "conclusion"]
-    reference_dict = parse_references(article)
     sections = []
 
-    # Handle abstract section
-    abstract = article.find("abstract")
-    abstract_text = abstract.find_all("div", attrs={"xmlns": "http://www.tei-c.org/ns/1.0"})
-    if abstract_text:
-        sections.append({
-            "heading": "# Abstract\n\n",
-            "text": ""
-        })
-    
     for abstract_div in abstract_text:
-        abstract_list = list(abstract_div.children)
-        if not abstract_list:
+        if not sections:
+            # Handle abstract section, its heading comes first once the abstract has any div
+            sections.append({
+                "heading": "# Abstract\n\n",
+                "text": []
+            })
+        
+        # Peek at the first two children instead of building a list of all of them
+        children = abstract_div.iterchildren()
+        first_child = next(children, None)
+        if first_child is None:
             continue
-        if len(abstract_list) == 1:
+        second_child = next(children, None)
+        if second_child is None:
             sections.append({
                 "heading": "",
-                "text": reconstruct_paragraph(abstract_list[0], reference_dict)+"\n\n"
+                "text": [reconstruct_paragraph(first_child, reference_dict), "\n\n"]
             })
             continue
         
         heading = ""
         text_parts = []
-        if isinstance(abstract_list[0], NavigableString):
-            heading_text = abstract_list[0].text
+        if first_child.tag == HEAD_TAG:
+            heading_text = element_text(first_child)
+            if _IRRELEVANT_RE.search(heading_text):
+                # Skip irrelevant sections before rebuilding their paragraphs
+                continue
             # Add \n to separate header-paragraph in same section
             heading = f"## {heading_text}\n"
-            p_all = abstract_list[1:]
+            p_all = chain((second_child,), children)
         else:
-            p_all = abstract_list
+            p_all = chain((first_child, second_child), children)
             
         for p in p_all:
-            if p is not None:
-                text_parts.append(reconstruct_paragraph(p, reference_dict))
-            if p == p_all[-1]:
-                # Add \n\n between last paragraph and the following section
-                text_parts[-1] += "\n\n"
-            else:
-                # Add \n to separate paragraph-paragraph in same section
-                text_parts[-1] += "\n"
+            text_parts.append(reconstruct_paragraph(p, reference_dict))
+            # Add \n to separate paragraph-paragraph in same section
+            text_parts.append("\n")
+        # Add \n\n between last paragraph and the following section
+        text_parts[-1] = "\n\n"
                 
         if heading or text_parts:
             # If you change to 'and' not 'or', some sections that does not have heading will be skipped
@@ -266,25 +528,26 @@ def parse_text(article):
                 "text": text_parts
             })
 
-    # Handle body section (Cannot change to body tag, else abstract section will process twice)
-    article_text = article.find("text")
-    divs = article_text.find_all("div", attrs={"xmlns": "http://www.tei-c.org/ns/1.0"})
+    # Handle body and back sections
     for div in divs:
-        div_list = list(div.children)
-        
-        if not div_list:
+        children = div.iterchildren()
+        first_child = next(children, None)
+        if first_child is None:
             continue
             
-        if len(div_list) == 1:
-            if isinstance(div_list[0], NavigableString):
-                sections.append({
-                    "heading": f"# {div_list[0]}\n\n",
-                    "text": ""
-                })
+        second_child = next(children, None)
+        if second_child is None:
+            if first_child.tag == HEAD_TAG:
+                heading_text = element_text(first_child)
+                if not _IRRELEVANT_RE.search(heading_text):
+                    sections.append({
+                        "heading": f"# {heading_text}\n\n",
+                        "text": []
+                    })
             else:
                 sections.append({
                     "heading": "",
-                    "text": reconstruct_paragraph(div_list[0], reference_dict)
+                    "text": [reconstruct_paragraph(first_child, reference_dict)]
                 })
             continue
             
@@ -292,23 +555,23 @@ def parse_text(article):
         heading = ""
         text_parts = []
         
-        if isinstance(div_list[0], NavigableString):
-            heading_text = div_list[0].text
+        if first_child.tag == HEAD_TAG:
+            heading_text = element_text(first_child)
+            if _IRRELEVANT_RE.search(heading_text):
+                # Skip irrelevant sections before rebuilding their paragraphs
+                continue
             # Add \n to separate header-paragraph in same section
             heading = f"# {heading_text}\n" if heading_text.strip().lower() in common_titles else f"## {heading_text}\n"
-            p_all = div_list[1:]
+            p_all = chain((second_child,), children)
         else:
-            p_all = div_list
+            p_all = chain((first_child, second_child), children)
             
         for p in p_all:
-            if p is not None:
-                text_parts.append(reconstruct_paragraph(p, reference_dict))
-            if p == p_all[-1]:
-                # Add \n\n between last paragraph and the following section
-                text_parts[-1] += "\n\n"
-            else:
-                # Add \n to separate paragraph-paragraph in same section
-                text_parts[-1] += "\n"
+            text_parts.append(reconstruct_paragraph(p, reference_dict))
+            # Add \n to separate paragraph-paragraph in same section
+            text_parts.append("\n")
+        # Add \n\n between last paragraph and the following section
+        text_parts[-1] = "\n\n"
                 
         if heading or text_parts:
             # If you change to 'and' not 'or', some sections that does not have heading will be skipped
@@ -317,17 +580,80 @@ def parse_text(article):
                 "text": text_parts
             })
             
-    # Concatenate all sections into a single string
-    article_text = ""
-    # Filter out irrelevant sections
-    irrelevant_sections = ["acknowledgement", "conflict of interest", "funding", "author contribution", 
-                            "competing interests", "supplementary material", "additional information", 
-                            "supplementary information", "data availability", "appendix"]
+    # Concatenate all sections into a single string, irrelevant sections are already left out
+    out = []
     for section in sections:
-        if any(x.strip() in section["heading"].strip().lower() for x in irrelevant_sections):
-            continue
-        article_text += section["heading"]
-        for text_part in section["text"]:
-            article_text += text_part
+        out.append(section["heading"])
+        out.extend(section["text"])
+    article_text = ''.join(out)
     
-    return len(reference_dict), article_text
\ No newline at end of file
+    return len(reference_dict), article_text
+
+def parse_file(pdf_path: str, parser: GrobidParser = None, header_only: bool = False, use_cache: bool = False) -> dict:
+    """Parse one PDF given by its path"""
+    parser = parser or GrobidParser()
+    root_folder, pdf_file = os.path.split(os.path.abspath(pdf_path))
+    result = parser.parse_pdf(root_folder, pdf_file, use_cache=use_cache, header_only=header_only)
+    if not isinstance(result, dict):
+        parser.logger.error("Failed to parse %s", pdf_file)
+        return None
+    return result
+
+def parse_to_csv(pdf_path: str, parser: GrobidParser = None, header_only: bool = False, use_cache: bool = False) -> str:
+    """Parse one PDF and write its results next to it, return the CSV path"""
+    parser = parser or GrobidParser()
+    result = parse_file(pdf_path, parser, header_only, use_cache)
+    if result is None:
+        return None
+    # One CSV per document keeps the batch tasks independent
+    output_path = f"{os.path.splitext(os.path.abspath(pdf_path))[0]}_results.csv"
+    export_csv(result, output_path)
+    parser.logger.info("Parsed results saved to %s", output_path)
+    return output_path
+
+def parse_to_merged_csv(pdf_files: list, output_path: str, parser: GrobidParser, workers: int,
+                        header_only: bool = False, use_cache: bool = False) -> int:
+    """Parse PDFs in parallel into a single CSV, return the number of rows written"""
+    count = 0
+    with open_csv(output_path) as writer, ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(lambda pdf_path: parse_file(pdf_path, parser, header_only, use_cache), pdf_files)
+        # Write every result as soon as its turn comes instead of collecting them all in memory,
+        # map keeps the sorted file order so every run gives the same rows
+        for pdf_path, result in zip(pdf_files, results):
+            if result is None:
+                continue
+            if count == 0:
+                writer.writerow(['', 'file', *result.keys()])
+            writer.writerow([count, os.path.basename(pdf_path), *(value[0] for value in result.values())])
+            count += 1
+    return count
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Parse scholarly PDFs with Grobid and export the results as CSV")
+    arg_parser.add_argument("pdf", nargs="?", help="PDF file to parse")
+    arg_parser.add_argument("--dir", help="Parse every PDF in this folder")
+    arg_parser.add_argument("--workers", type=int, default=GROBID_MAX_CONNECTIONS,
+                            help="Number of PDFs sent to Grobid in parallel with --dir")
+    arg_parser.add_argument("--output", help="With --dir, write all results to this CSV instead of one CSV per PDF")
+    arg_parser.add_argument("--header-only", action="store_true",
+                            help="Only export the metadata (title, journal, DOI, ...), skip the article text")
+    arg_parser.add_argument("--no-cache", action="store_true",
+                            help="Do not read or write the parsed result cache (<name>.grobid.tei.xml.cache.json)")
+    args = arg_parser.parse_args()
+    use_cache = not args.no_cache
+
+    if args.dir:
+        pdf_files = sorted(glob.glob(os.path.join(args.dir, "*.pdf")))
+        # Threads share one pooled session, so Grobid, the network and XML parsing overlap
+        grobid_parser = GrobidParser(pool_size=args.workers)
+        if args.output:
+            parsed = parse_to_merged_csv(pdf_files, args.output, grobid_parser, args.workers, args.header_only, use_cache)
+            print(f"Parsed {parsed}/{len(pdf_files)} PDF files into {args.output}")
+        else:
+            with ThreadPoolExecutor(max_workers=args.workers) as executor:
+                results = list(executor.map(lambda pdf_path: parse_to_csv(pdf_path, grobid_parser, args.header_only, use_cache), pdf_files))
+            print(f"Parsed {sum(r is not None for r in results)}/{len(pdf_files)} PDF files")
+    elif args.pdf:
+        parse_to_csv(args.pdf, header_only=args.header_only, use_cache=use_cache)
+    else:
+        arg_parser.error("Give a PDF file or --dir")
@@ -0,0 +1,36 @@
+"""Build the optional Cython speedup of reconstruct_paragraph with `python setup.py build_ext --inplace`"""
+import ast, hashlib, re, sys
+from setuptools import setup, Extension
+try:
+    from Cython.Build import cythonize
+except ImportError:
+    # Cython is optional, without it the parser keeps the pure Python reconstruct_paragraph
+    cythonize = None
+
+def python_digest() -> str:
+    """source_digest() of reconstruct_paragraph in model/grobid_parse.py, read without importing the module"""
+    with open("model/grobid_parse.py", encoding="utf-8") as f:
+        source = f.read()
+    node = next(n for n in ast.parse(source).body
+                if isinstance(n, ast.FunctionDef) and n.name == "reconstruct_paragraph")
+    lines = source.splitlines(keepends=True)[node.lineno - 1:node.end_lineno]
+    return hashlib.sha256("".join(lines).encode("utf-8")).hexdigest()[:16]
+
+def ported_digest() -> str:
+    """PORTED_FROM recorded in model/_fast_reconstruct.pyx"""
+    with open("model/_fast_reconstruct.pyx", encoding="utf-8") as f:
+        return re.search(r'^PORTED_FROM = "(\w+)"', f.read(), re.MULTILINE).group(1)
+
+if cythonize and ported_digest() != python_digest():
+    # The compiled copy would not match the Python code, grobid_parse would not load it anyway
+    print("model/_fast_reconstruct.pyx is out of date with reconstruct_paragraph, port the change and set "
+          f"PORTED_FROM = \"{python_digest()}\", building without the Cython speedup", file=sys.stderr)
+    cythonize = None
+
+setup(
+    name="grobid-parser",
+    ext_modules=cythonize(
+        [Extension("model._fast_reconstruct", ["model/_fast_reconstruct.pyx"])],
+        language_level=3,
+    ) if cythonize else [],
+)